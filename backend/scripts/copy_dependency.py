@@ -1,22 +1,182 @@
 import argparse
+import json
+import os
 import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-def collect_dlls(roots):
-    seen = set()
+if sys.platform == "win32":
+    import ctypes
+
+    _kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    _CopyFileW = _kernel32.CopyFileW
+    _CopyFileW.argtypes = [ctypes.c_wchar_p, ctypes.c_wchar_p, ctypes.c_bool]
+    _CopyFileW.restype = ctypes.c_bool
+
+    def copy_file(src, dst):
+        # CopyFileW copies in the kernel and preserves timestamps/attributes,
+        # avoiding shutil's user-space read/write loop on older Pythons.
+        if not _CopyFileW(os.fspath(src), os.fspath(dst), False):
+            raise ctypes.WinError(ctypes.get_last_error())
+
+else:
+    copy_file = shutil.copy2
+
+
+def in_dest(path, dest_prefix):
+    return os.path.join(os.path.normcase(path), "").startswith(dest_prefix)
+
+
+def collect_dlls(roots, dest_prefix, dir_mtimes=None):
+    # dest is never walked: its DLLs are copies, and its mtime changes on every
+    # copy, which would invalidate the manifest on the next run.
     files = []
     for root in roots:
         if not root:
             continue
-        root_path = Path(root)
-        if not root_path.is_dir():
+        if not os.path.isdir(root):
+            if dir_mtimes is not None:
+                dir_mtimes.append([root, None])
             continue
-        for path in root_path.rglob("*.dll"):
-            if path.is_file():
-                files.append(path)
+        # Resolve each root once; the walk never follows links, so every
+        # entry path below it is already absolute and canonical.
+        root = os.path.realpath(root)
+        if in_dest(root, dest_prefix):
+            continue
+        stack = [root]
+        while stack:
+            current = stack.pop()
+            try:
+                if dir_mtimes is not None:
+                    dir_mtimes.append([current, os.stat(current).st_mtime_ns])
+                with os.scandir(current) as entries:
+                    # DirEntry type checks use the dirent data from the
+                    # enumeration; the name test runs first so non-DLL files
+                    # only pay for the is_dir() check.
+                    for entry in entries:
+                        if entry.name.lower().endswith(".dll"):
+                            if entry.is_file(follow_symlinks=False):
+                                try:
+                                    files.append((entry, entry.stat()))
+                                except OSError:
+                                    pass
+                                continue
+                        if entry.is_dir(follow_symlinks=False) and not in_dest(
+                            entry.path, dest_prefix
+                        ):
+                            stack.append(entry.path)
+            except OSError:
+                continue
     return files
 
 
+def manifest_path(stamp_file):
+    return Path(f"{stamp_file}.manifest.json")
+
+
+def load_manifest(stamp_file):
+    try:
+        return json.loads(manifest_path(stamp_file).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(stamp_file, manifest):
+    # Rewritten in place rather than via a temp file + rename: the stamp lives
+    # in a walked root, and adding or renaming an entry there would change the
+    # directory mtime just recorded and invalidate the manifest on every run.
+    try:
+        manifest_path(stamp_file).write_text(json.dumps(manifest))
+    except OSError as exc:
+        warn(f"Warning: Could not write copy manifest: {exc}")
+
+
+def manifest_is_current(manifest, dest, roots):
+    # Directory mtimes catch added/removed DLLs; the per-file size+mtime tuples
+    # catch DLLs rewritten in place and targets that were touched or deleted.
+    if not isinstance(manifest, dict):
+        return False
+    if manifest.get("dest") != str(dest) or manifest.get("roots") != roots:
+        return False
+    try:
+        for directory, mtime_ns in manifest["dirs"]:
+            if mtime_ns is None:
+                # Root was missing last time; it must still be missing.
+                if os.path.isdir(directory):
+                    return False
+            elif os.stat(directory).st_mtime_ns != mtime_ns:
+                return False
+        for source, size, mtime_ns in manifest["files"]:
+            source_stat = os.stat(source)
+            if source_stat.st_size != size or source_stat.st_mtime_ns != mtime_ns:
+                return False
+            target_stat = os.stat(dest / os.path.basename(source))
+            if target_stat.st_size != size or target_stat.st_mtime_ns != mtime_ns:
+                return False
+    except (OSError, KeyError, TypeError, ValueError):
+        return False
+    return True
+
+
+def write_stamp(stamp_file):
+    # Raw fd write: no BufferedWriter/TextIOWrapper for a 7-byte file.
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    fd = os.open(stamp_file, flags, 0o644)
+    try:
+        os.write(fd, b"copied\n")
+    finally:
+        os.close(fd)
+
+
+print_lock = threading.Lock()
+
+
+def warn(message):
+    with print_lock:
+        print(message)
+
+
+def dedup_dlls(dlls):
+    # Several roots can ship the same DLL name (e.g. vcpkg bin and debug/bin).
+    # The later root wins, as it did when every copy ran in root order, and
+    # each target is written by a single worker.
+    return list({os.path.normcase(dll.name): (dll, st) for dll, st in dlls}.values())
+
+
+def copy_one(dll, dll_stat, dest):
+    # Returns whether the DLL is up to date in dest.
+    target = dest / dll.name
+
+    try:
+        target_stat = os.stat(target)
+    except OSError:
+        target_stat = None
+    if (
+        target_stat
+        and target_stat.st_size == dll_stat.st_size
+        and target_stat.st_mtime_ns == dll_stat.st_mtime_ns
+    ):
+        return True
+
+    try:
+        copy_file(dll.path, target)
+        # Pin the exact source timestamp so the next run's ns comparison
+        # (and the manifest check) matches regardless of copy precision.
+        os.utime(target, ns=(dll_stat.st_atime_ns, dll_stat.st_mtime_ns))
+    except PermissionError:
+        warn(
+            f"Warning: Could not update {dll.name} (file locked). "
+            "Ensure TinyTorrent is closed."
+        )
+        return False
+    except Exception as exc:
+        warn(f"Error copying {dll.name}: {exc}")
+        return False
+    return True
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Copy all DLL dependencies from provided roots to dest."
@@ -28,48 +188,36 @@ def main():
 
     dest = Path(args.dest_dir)
     dest.mkdir(parents=True, exist_ok=True)
-    dest_resolved = dest.resolve()
-
-    dlls = collect_dlls(args.roots)
-    for dll in dlls:
-        try:
-            dll_resolved = dll.resolve()
-        except OSError:
-            dll_resolved = dll
-        if dest_resolved in dll_resolved.parents:
-            continue
-        target = dest / dll.name
-        dll_stat = None
-        try:
-            dll_stat = dll_resolved.stat()
-        except OSError:
-            pass
-
-        skip_copy = False
-        if dll_stat and target.exists():
-            try:
-                target_stat = target.stat()
-                if (
-                    target_stat.st_size == dll_stat.st_size
-                    and int(target_stat.st_mtime) == int(dll_stat.st_mtime)
-                ):
-                    skip_copy = True
-            except OSError:
-                pass
-        if skip_copy:
-            continue
+    # Joining with "" appends a trailing separator (unless dest is a drive root)
+    # so the containment test is a plain string prefix check against the
+    # already-resolved walk paths.
+    dest_prefix = os.path.join(os.path.normcase(os.path.realpath(dest)), "")
+
+    if manifest_is_current(load_manifest(args.stamp_file), dest, args.roots):
+        write_stamp(args.stamp_file)
+        return
+
+    dir_mtimes = []
+    dlls = dedup_dlls(collect_dlls(args.roots, dest_prefix, dir_mtimes))
+    manifest = {
+        "dest": str(dest),
+        "roots": args.roots,
+        "dirs": dir_mtimes,
+        "files": [
+            [dll.path, dll_stat.st_size, dll_stat.st_mtime_ns]
+            for dll, dll_stat in dlls
+        ],
+    }
+    workers = min(8, os.cpu_count() or 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(copy_one, dll, dll_stat, dest) for dll, dll_stat in dlls
+        ]
+        complete = all([future.result() for future in as_completed(futures)])
 
-        try:
-            shutil.copy2(dll, target)
-        except PermissionError:
-            print(
-                f"Warning: Could not update {dll.name} (file locked). "
-                "Ensure TinyTorrent is closed.",
-            )
-        except Exception as exc:
-            print(f"Error copying {dll.name}: {exc}")
-
-    Path(args.stamp_file).write_text("copied\n")
+    # An empty manifest never matches, so a failed run is retried in full.
+    write_manifest(args.stamp_file, manifest if complete else {})
+    write_stamp(args.stamp_file)
 
 
 if __name__ == "__main__":
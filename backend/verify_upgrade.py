@@ -17,11 +17,13 @@ import http.client
 import base64
 import json
 import os
+import re
 import secrets
 import socket
 import subprocess
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import tempfile
 
@@ -33,6 +35,20 @@ BACKEND_BINARY = "./buildstate/debug/tinytorrent-daemon.exe"
 RPC_PATH = "/transmission/rpc"
 WS_PATH = "/ws"
 
+# Backend log lines that announce the RPC port.
+RPC_PORT_RE = re.compile(r"RPC listening on port\s+(\d+)")
+POST_URL_PORT_RE = re.compile(r"POST requests should hit\s+http://[^/:\s]+:(\d+)")
+
+
+# The backend reader thread and the concurrent RPC checks all write to stdout;
+# print() emits the text and the newline separately, so serialize them.
+print_lock = threading.Lock()
+
+
+def log(message, end="\n"):
+    with print_lock:
+        print(message, end=end, flush=True)
+
 
 def connection_json_path():
     # Must match tt::utils::data_root().
@@ -47,11 +63,16 @@ def connection_json_path():
 
 
 def read_connection_port(expected_pid=None):
+    # start_backend polls this while waiting for the daemon; only re-read and
+    # re-parse the file when its path or mtime changes.
+    cache = read_connection_port.cache
     try:
         path = connection_json_path()
-        if not path.is_file():
-            return None
-        payload = json.loads(path.read_text(encoding="utf-8"))
+        mtime_ns = path.stat().st_mtime_ns
+        if cache["path"] != path or cache["mtime_ns"] != mtime_ns:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+            cache.update(path=path, mtime_ns=mtime_ns, payload=payload)
+        payload = cache["payload"]
         if expected_pid is not None and payload.get("pid") != expected_pid:
             return None
         port = payload.get("port")
@@ -62,6 +83,9 @@ def read_connection_port(expected_pid=None):
     return None
 
 
+read_connection_port.cache = {"path": None, "mtime_ns": None, "payload": None}
+
+
 def backend_data_root():
     return connection_json_path().parent
 
@@ -70,6 +94,13 @@ def random_secret():
     return secrets.token_hex(16)
 
 
+def parse_port_line(line):
+    match = RPC_PORT_RE.search(line) or POST_URL_PORT_RE.search(line)
+    if match:
+        return int(match.group(1))
+    return None
+
+
 def start_backend(secret):
     # Isolate acceptance tests from any running instance by using a dedicated
     # data root (also avoids sharing tinytorrent.db / tinytorrent.log).
@@ -83,84 +114,88 @@ def start_backend(secret):
         text=True,
         bufsize=1,
     )
-    output_lines = []
+    port_box = [None]
+    port_event = threading.Event()
 
     def reader():
         for line in proc.stdout:
-            print(line, end="")
-            output_lines.append(line)
+            log(line, end="")
+            if port_box[0] is None:
+                port = parse_port_line(line)
+                if port:
+                    port_box[0] = port
+                    port_event.set()
 
     threading.Thread(target=reader, daemon=True).start()
 
     port = None
+    # Start with a short wait so a fast backend is noticed quickly, then back
+    # off toward 100 ms for the exit/connection.json checks.
+    interval = 0.005
     deadline = time.time() + 30
     while time.time() < deadline:
+        if port_event.wait(interval):
+            port = port_box[0]
+            break
         if proc.poll() is not None:
             raise RuntimeError("backend exited before listening")
-        for line in reversed(output_lines):
-            if "RPC listening on port" in line:
-                try:
-                    port = int(line.split("port")[1].strip().split()[0])
-                except Exception:
-                    pass
-            if "POST requests should hit" in line and port is None:
-                parts = line.split("POST requests should hit")
-                if len(parts) == 2:
-                    url = parts[1].strip()
-                    if url.startswith("http://"):
-                        host_port = url.split("/")[2]
-                        port = int(host_port.split(":")[1])
+        port = read_connection_port(proc.pid)
         if port:
             break
-        if port is None:
-            port = read_connection_port(proc.pid)
-            if port:
-                break
-        time.sleep(0.1)
+        interval = min(interval * 1.5, 0.1)
     if port is None:
         raise RuntimeError("failed to detect RPC port")
     return proc, port
 
 
-def post_rpc(port, secret, payload, origin="tt-app://local.ui"):
-    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+def post_rpc(conn, secret, payload, origin="tt-app://local.ui"):
+    # conn is shared across calls (HTTP/1.1 keep-alive); if the daemon dropped
+    # the idle connection, reconnect once and resend.
+    body = json.dumps(payload).encode("utf-8")
     headers = {
         "Content-Type": "application/json",
         "X-TT-Auth": secret,
         "Origin": origin,
+        "Connection": "keep-alive",
     }
-    conn.request("POST", RPC_PATH, json.dumps(payload), headers)
-    resp = conn.getresponse()
-    body = resp.read()
-    conn.close()
+    for attempt in range(2):
+        try:
+            conn.request("POST", RPC_PATH, body, headers)
+            resp = conn.getresponse()
+            raw = resp.read()
+            break
+        except (http.client.RemoteDisconnected, ConnectionError):
+            conn.close()
+            if attempt:
+                raise
     try:
-        data = json.loads(body.decode("utf-8"))
+        data = json.loads(raw.decode("utf-8"))
     except Exception:
-        data = body.decode("utf-8", errors="ignore")
+        data = raw.decode("utf-8", errors="ignore")
     return resp.status, data
 
 
-def test_capabilities(port, secret):
-    status, body = post_rpc(port, secret, {"method": "tt-get-capabilities"})
+def test_capabilities(conn, secret):
+    status, body = post_rpc(conn, secret, {"method": "tt-get-capabilities"})
     assert status == 200, "tt-get-capabilities failed"
     assert body.get("arguments", {}).get("server-version") == "TinyTorrent 1.1.0"
     assert body.get("arguments", {}).get("server-class") == "tinytorrent"
-    print("  [ok] capability response meets spec")
+    log("  [ok] capability response meets spec")
 
 
-def test_origin_block(port, secret):
+def test_origin_block(conn, secret):
     status, _body = post_rpc(
-        port, secret, {"method": "tt-get-capabilities"}, origin="http://evil-site.com"
+        conn, secret, {"method": "tt-get-capabilities"}, origin="http://evil-site.com"
     )
     if status == 403:
-        print("  [ok] origin lock enforced")
+        log("  [ok] origin lock enforced")
     elif status == 200:
-        print("  [warn] origin lock bypassed (likely debug build)")
+        log("  [warn] origin lock bypassed (likely debug build)")
     else:
         raise AssertionError("origin lock failed")
 
 
-def test_torrent_errors(port, secret):
+def test_torrent_errors(conn, secret):
     # metainfo-path missing file
     data_root = backend_data_root()
     downloads_dir = data_root / "downloads"
@@ -172,22 +207,22 @@ def test_torrent_errors(port, secret):
             "download-dir": str(downloads_dir),
         },
     }
-    status, body = post_rpc(port, secret, payload)
+    status, body = post_rpc(conn, secret, payload)
     assert status == 200
     code = body.get("arguments", {}).get("code")
     assert code == 4002, f"expected 4002 for metainfo path failure, got {code}"
-    print("  [ok] metainfo-path rejection (4002)")
+    log("  [ok] metainfo-path rejection (4002)")
 
     # invalid download path
     payload = {
         "method": "torrent-add",
         "arguments": {"download-dir": "?:/InvalidPath", "uri": "magnet:?xt=urn:btih:1234"},
     }
-    status, body = post_rpc(port, secret, payload)
+    status, body = post_rpc(conn, secret, payload)
     assert status == 200
     code = body.get("arguments", {}).get("code")
     assert code in (4001, 4003), f"expected 4001/4003 for bad path, got {code}"
-    print("  [ok] invalid download path returns 4001/4003")
+    log("  [ok] invalid download path returns 4001/4003")
 
 
 def recv_exact(sock, count):
@@ -200,6 +235,19 @@ def recv_exact(sock, count):
     return data
 
 
+def unmask(payload, mask):
+    # XOR the whole payload against the repeated mask as one big integer: a
+    # single C-level operation over the frame, several times faster than an
+    # 8-byte struct (SWAR) loop and with no numpy dependency.
+    length = len(payload)
+    if not length:
+        return payload
+    key = (mask * (length // 4 + 1))[:length]
+    return (
+        int.from_bytes(payload, "little") ^ int.from_bytes(key, "little")
+    ).to_bytes(length, "little")
+
+
 def websocket_sequence(port, secret):
     sock = socket.create_connection(("127.0.0.1", port), timeout=5)
     sec_key = base64.b64encode(secrets.token_bytes(16)).decode()
@@ -216,29 +264,25 @@ def websocket_sequence(port, secret):
     ]
     sock.sendall("\r\n".join(headers).encode())
 
-    response = b""
-    while b"\r\n\r\n" not in response:
-        chunk = sock.recv(4096)
-        if not chunk:
+    # A large read buffer lets the handshake and the first frames arrive in a
+    # single recv() instead of one 4 KiB read per call.
+    stream = sock.makefile("rb", buffering=128 * 1024)
+    header_blob = b""
+    while not header_blob.endswith(b"\r\n\r\n"):
+        line = stream.readline(65536)
+        if not line:
             raise RuntimeError("websocket handshake failed (socket closed)")
-        response += chunk
-        if len(response) > 65536:
+        header_blob += line
+        if len(header_blob) > 65536:
             raise RuntimeError("websocket handshake failed (oversized response)")
-    header_blob, leftover = response.split(b"\r\n\r\n", 1)
     if b"101" not in header_blob:
         raise RuntimeError("websocket handshake failed")
 
-    buffer = bytearray(leftover)
-
     def recv_exact_ws(count):
-        while len(buffer) < count:
-            chunk = sock.recv(4096)
-            if not chunk:
-                raise RuntimeError("socket closed")
-            buffer.extend(chunk)
-        out = bytes(buffer[:count])
-        del buffer[:count]
-        return out
+        data = stream.read(count)
+        if len(data) < count:
+            raise RuntimeError("socket closed")
+        return data
 
     def read_frame():
         header = recv_exact_ws(2)
@@ -253,7 +297,7 @@ def websocket_sequence(port, secret):
             mask = None
         payload = recv_exact_ws(length)
         if mask:
-            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            payload = unmask(payload, mask)
         return payload
 
     deadline = time.time() + 10
@@ -265,9 +309,11 @@ def websocket_sequence(port, secret):
             continue
         if data.get("type") == "sync-patch" or "sequence" in data:
             assert "sequence" in data, "sync-patch missing sequence"
-            print("  [ok] websocket sync-patch has sequence")
+            log("  [ok] websocket sync-patch has sequence")
+            stream.close()
             sock.close()
             return
+    stream.close()
     sock.close()
     raise RuntimeError("no sync-patch received with sequence")
 
@@ -275,16 +321,31 @@ def websocket_sequence(port, secret):
 def main():
     secret = random_secret()
     proc = None
+    conns = []
     try:
-        print("[*] Launching backend with session secret")
+        log("[*] Launching backend with session secret")
         proc, port = start_backend(secret)
-        print(f"[*] detected RPC port {port}")
-        test_capabilities(port, secret)
-        test_origin_block(port, secret)
-        test_torrent_errors(port, secret)
+        log(f"[*] detected RPC port {port}")
+        # The RPC checks are independent, so run them concurrently; each gets
+        # its own keep-alive connection since HTTPConnection is not
+        # thread-safe. The WebSocket check runs afterwards on its own.
+        rpc_tests = [test_capabilities, test_origin_block, test_torrent_errors]
+        conns = [
+            http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            for _test in rpc_tests
+        ]
+        with ThreadPoolExecutor(max_workers=len(rpc_tests)) as executor:
+            futures = [
+                executor.submit(test, conn, secret)
+                for test, conn in zip(rpc_tests, conns)
+            ]
+            for future in futures:
+                future.result()
         websocket_sequence(port, secret)
-        print("[*] All acceptance tests passed")
+        log("[*] All acceptance tests passed")
     finally:
+        for conn in conns:
+            conn.close()
         if proc:
             proc.terminate()
             try: